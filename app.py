@@ -1,10 +1,14 @@
-from flask import Flask, request, jsonify, send_from_directory, render_template, session
+from flask import Flask, request, jsonify, send_from_directory, send_file, render_template, session
+import io
 import os
 import shutil 
 import json
 import uuid
-from generate_handwritten_text import generate_text_image
+from generate_handwritten_text import generate_text_image, word_strip_cache, line_strip_cache
 from extract_letters import extract_characters_from_image
+from render_pool import RenderPool, RenderQueueFull, render_pool_settings
+from glyph_cache import cleanup_segments, release_font
+from font_bundle import BUNDLE_EXTENSION, export_font_bundle, import_font_bundle
 
 app = Flask(__name__, static_folder="frontend", template_folder="frontend")
 # app.secret_key = 'your_secret_key_here' # Needed for Flask sessions, if you go that route
@@ -13,6 +17,13 @@ OUTPUT_FOLDER = "output"
 UPLOAD_FOLDER = "uploads"
 EXTRACTED_FONTS_BASE_FOLDER = "extracted_fonts"
 
+# Rendering and extraction are CPU-heavy, so they run on a dedicated bounded pool
+# instead of the request threads. Requests beyond RENDER_WORKERS + RENDER_QUEUE_LIMIT
+# are rejected with 503 and a Retry-After hint. The pool is per process, so each
+# gunicorn worker process gets its own (see gunicorn.conf.py).
+RENDER_WORKERS, RENDER_QUEUE_LIMIT = render_pool_settings()
+render_pool = RenderPool(RENDER_WORKERS, RENDER_QUEUE_LIMIT)
+
 # Using a global variable for active_font_folder_name.
 # IMPORTANT: For multi-user environments, replace this with Flask sessions or a database lookup.
 active_font_folder_name = None
@@ -24,6 +35,9 @@ if not os.path.exists(UPLOAD_FOLDER):
 if not os.path.exists(EXTRACTED_FONTS_BASE_FOLDER):
     os.makedirs(EXTRACTED_FONTS_BASE_FOLDER)
 
+# Remove shared glyph segments of fonts that were re-mapped or deleted while the server was down
+cleanup_segments(EXTRACTED_FONTS_BASE_FOLDER)
+
 # Helper to get/set active font (can be used by multiple routes)
 def get_active_font_id():
     # In a real app, this would be session.get('active_font_id')
@@ -34,6 +48,11 @@ def set_active_font_id(font_id):
     active_font_folder_name = font_id
     # In a real app, this would be session['active_font_id'] = font_id
 
+def render_queue_full_response(e):
+    response = jsonify({"success": False, "error": "Server is busy, please retry shortly.", "retry_after": e.retry_after})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, 503
+
 @app.route('/<path:filename>')
 def serve_static(filename):
     return send_from_directory("frontend", filename)
@@ -81,7 +100,7 @@ def get_fonts():
     fonts = []
     for font_dir in os.listdir(EXTRACTED_FONTS_BASE_FOLDER):
         full_path = os.path.join(EXTRACTED_FONTS_BASE_FOLDER, font_dir)
-        if os.path.isdir(full_path):
+        if os.path.isdir(full_path) and not font_dir.startswith("."): # Skip in-progress bundle imports
             metadata_path = os.path.join(full_path, "metadata.json")
             display_name = font_dir # Default to folder name
             if os.path.exists(metadata_path):
@@ -124,7 +143,10 @@ def generate():
 
     output_path = os.path.join(OUTPUT_FOLDER, "generated_text.png")
     # Pass the font's image folder and mapping file path to generate_text_image
-    generate_text_image(user_text, output_path, current_font_path, current_mapping_file)
+    try:
+        render_pool.run(generate_text_image, user_text, output_path, current_font_path, current_mapping_file)
+    except RenderQueueFull as e:
+        return render_queue_full_response(e)
 
     return jsonify({"success": True, "image_url": "/output/generated_text.png"})
 
@@ -146,6 +168,7 @@ def delete_font():
         # Delete the corresponding local folder and its contents
         font_local_path = os.path.join(EXTRACTED_FONTS_BASE_FOLDER, font_id_to_delete)
         if os.path.exists(font_local_path):
+            release_font(font_local_path, os.path.join(font_local_path, "character_mapping.json"))
             shutil.rmtree(font_local_path)
             print(f"Deleted local font folder: {font_local_path}")
         else:
@@ -157,6 +180,59 @@ def delete_font():
         print(f"Error deleting font '{font_id_to_delete}': {e}")
         return jsonify({"success": False, "error": f"Error deleting font: {str(e)}"}), 500
 
+@app.route("/export_font/<font_id>", methods=["GET"])
+def export_font(font_id):
+    font_path = os.path.join(EXTRACTED_FONTS_BASE_FOLDER, font_id)
+    mapping_file = os.path.join(font_path, "character_mapping.json")
+    if not os.path.exists(mapping_file):
+        return jsonify({"success": False, "error": "Font not found."}), 404
+
+    # Prepared glyphs are included unless ?prepared=0 is passed
+    include_prepared_glyphs = request.args.get("prepared", "1") != "0"
+    bundle = io.BytesIO()
+    try:
+        render_pool.run(export_font_bundle, font_path, bundle, include_prepared_glyphs)
+    except RenderQueueFull as e:
+        return render_queue_full_response(e)
+    bundle.seek(0)
+
+    return send_file(bundle, mimetype="application/zip", as_attachment=True,
+                     download_name=f"{font_id}{BUNDLE_EXTENSION}")
+
+@app.route("/import_font", methods=["POST"])
+def import_font():
+    if 'file' not in request.files:
+        return jsonify({"success": False, "error": "No file part"}), 400
+
+    try:
+        font_id, created = import_font_bundle(request.files['file'].stream, EXTRACTED_FONTS_BASE_FOLDER)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    font_name = font_id
+    metadata_path = os.path.join(EXTRACTED_FONTS_BASE_FOLDER, font_id, "metadata.json")
+    if os.path.exists(metadata_path):
+        try:
+            with open(metadata_path, "r") as f:
+                font_name = json.load(f).get("font_name", font_id)
+        except json.JSONDecodeError:
+            pass
+
+    global active_font_folder_name
+    active_font_folder_name = font_id # Set the imported font as active
+
+    message = f"Font '{font_name}' imported." if created else f"Font '{font_name}' was already imported."
+    return jsonify({"success": True, "message": message, "font_id": font_id, "font_name": font_name, "already_imported": not created})
+
+@app.route("/render_stats", methods=["GET"])
+def render_stats():
+    return jsonify({
+        "success": True,
+        "render_queue": render_pool.stats(),
+        "word_strip_cache": word_strip_cache.stats(),
+        "line_strip_cache": line_strip_cache.stats(),
+    })
+
 @app.route("/output/<filename>")
 def output_file(filename):
     return send_from_directory(OUTPUT_FOLDER, filename)
@@ -182,7 +258,11 @@ def upload_handwriting():
         filepath = os.path.join(UPLOAD_FOLDER, file.filename)
         file.save(filepath)
         
-        extracted_filenames = extract_characters_from_image(filepath, new_font_folder_path)
+        try:
+            extracted_filenames = render_pool.run(extract_characters_from_image, filepath, new_font_folder_path)
+        except RenderQueueFull as e:
+            shutil.rmtree(new_font_folder_path, ignore_errors=True)
+            return render_queue_full_response(e)
         
         # Save font metadata (name, uploaded filename) to local JSON
         metadata_path = os.path.join(new_font_folder_path, "metadata.json")
@@ -296,4 +376,4 @@ def save_mapping():
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=5000, debug=True, threaded=True)
\ No newline at end of file
@@ -0,0 +1,270 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+import zipfile
+
+from generate_handwritten_text import load_character_images
+from glyph_cache import PREPARED_GLYPHS_FILE, get_font_glyphs, pack_glyphs, read_segment
+
+# A font bundle is a single zip file holding everything needed to use a font on another node:
+#   manifest.json        format version, per-file SHA-256 and the font's content hash
+#   mapping.json         the font's character_mapping.json
+#   metadata.json        the font's metadata.json (font name etc.)
+#   glyphs/<name>.png    the extracted character images
+#   prepared_glyphs.bin  optional bit-packed, ready-to-render glyphs (see glyph_cache)
+#
+# The content hash covers every entry, including the prepared glyphs, and imported fonts
+# are stored under an ID derived from it, so importing the same bundle twice is a no-op.
+# Files are stored byte-for-byte, so re-exporting an imported font yields the same bundle.
+# A bundle exported with ?prepared=0 therefore gets a different ID than one with them.
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_EXTENSION = ".writeit"
+
+# Limits on the decompressed size of bundle entries, checked before anything is read
+MAX_ENTRY_BYTES = 16 * 1024 * 1024
+MAX_BUNDLE_BYTES = 256 * 1024 * 1024
+
+MANIFEST_ENTRY = "manifest.json"
+MAPPING_ENTRY = "mapping.json"
+METADATA_ENTRY = "metadata.json"
+PREPARED_GLYPHS_ENTRY = "prepared_glyphs.bin"
+GLYPH_ENTRY_PREFIX = "glyphs/"
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _content_sha256(file_hashes):
+    # Hash of the sorted (entry name, entry hash) pairs.
+    digest = hashlib.sha256()
+    for name in sorted(file_hashes):
+        digest.update(f"{name}\0{file_hashes[name]}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def font_id_for_bundle(content_sha256):
+    """
+    Returns the font folder name used for a bundle with the given content hash.
+    """
+    return str(uuid.UUID(hex=content_sha256[:32]))
+
+
+def export_font_bundle(font_folder, bundle_file, include_prepared_glyphs=True):
+    """
+    Writes a font folder to a single-file bundle. Mapping entries whose image file
+    is missing are left out, since they cannot be rendered anyway.
+
+    Args:
+        font_folder (str): Path to the font's directory (PNGs, character_mapping.json, metadata.json).
+        bundle_file: Path or writable binary file object to write the bundle to.
+        include_prepared_glyphs (bool): Whether to ship the bit-packed, ready-to-render glyphs,
+            so the receiving node does not have to prepare them from the PNGs again.
+
+    Returns:
+        str: The bundle's content hash.
+
+    Raises:
+        ValueError: If the font folder or its mapping file is not found.
+    """
+    mapping_path = os.path.join(font_folder, "character_mapping.json")
+    if not os.path.exists(mapping_path):
+        raise ValueError(f"❌ Error: Mapping file not found at {mapping_path}")
+
+    entries = {}
+    for filename in sorted(os.listdir(font_folder)):
+        if filename.endswith(".png"):
+            with open(os.path.join(font_folder, filename), "rb") as f:
+                entries[GLYPH_ENTRY_PREFIX + filename] = f.read()
+
+    with open(mapping_path, "rb") as f:
+        mapping_bytes = f.read()
+    char_mapping = json.loads(mapping_bytes)
+    if not isinstance(char_mapping, dict):
+        raise ValueError(f"❌ Error: Invalid mapping file at {mapping_path}")
+    bundled_mapping = {char: filename for char, filename in char_mapping.items()
+                       if GLYPH_ENTRY_PREFIX + str(filename) in entries}
+    if bundled_mapping != char_mapping:
+        print(f"⚠️ Warning: Leaving out mappings without an image file: {sorted(set(char_mapping) - set(bundled_mapping))}")
+        mapping_bytes = json.dumps(bundled_mapping, indent=4).encode("utf-8")
+    entries[MAPPING_ENTRY] = mapping_bytes
+
+    metadata_path = os.path.join(font_folder, "metadata.json")
+    if os.path.exists(metadata_path):
+        with open(metadata_path, "rb") as f:
+            entries[METADATA_ENTRY] = f.read()
+    else:
+        entries[METADATA_ENTRY] = json.dumps({}).encode("utf-8")
+
+    if include_prepared_glyphs:
+        # Re-pack so the segment is tagged with the hash of the mapping actually bundled.
+        # Glyphs are already binary, so this is lossless and gives identical bytes every time.
+        glyphs = get_font_glyphs(font_folder, mapping_path, load_character_images)
+        entries[PREPARED_GLYPHS_ENTRY] = pack_glyphs({char: glyphs.get(char) for char in glyphs},
+                                                     glyphs.height, _sha256(mapping_bytes))
+
+    file_hashes = {name: _sha256(data) for name, data in entries.items()}
+    content_sha256 = _content_sha256(file_hashes)
+    manifest = {
+        "format": BUNDLE_FORMAT_VERSION,
+        "content_sha256": content_sha256,
+        "files": file_hashes,
+    }
+
+    # PNGs are already compressed, so only the JSON entries are deflated
+    with zipfile.ZipFile(bundle_file, "w") as bundle:
+        bundle.writestr(MANIFEST_ENTRY, json.dumps(manifest, indent=4), compress_type=zipfile.ZIP_DEFLATED)
+        for name, data in entries.items():
+            compress_type = zipfile.ZIP_DEFLATED if name.endswith(".json") else zipfile.ZIP_STORED
+            bundle.writestr(name, data, compress_type=compress_type)
+
+    return content_sha256
+
+
+def _is_valid_entry_name(name):
+    if name in (MAPPING_ENTRY, METADATA_ENTRY, PREPARED_GLYPHS_ENTRY):
+        return True
+    if not name.startswith(GLYPH_ENTRY_PREFIX):
+        return False
+    filename = name[len(GLYPH_ENTRY_PREFIX):]
+    return filename.endswith(".png") and os.path.basename(filename) == filename \
+        and not filename.startswith(".") and "\\" not in filename
+
+
+def read_font_bundle(bundle_file):
+    """
+    Reads a bundle and verifies every entry against its manifest.
+
+    Args:
+        bundle_file: Path or readable binary file object of the bundle.
+
+    Returns:
+        tuple: A tuple containing:
+            - str: The bundle's content hash.
+            - dict: Entry names mapped to their contents.
+
+    Raises:
+        ValueError: If the bundle is malformed or fails its integrity check.
+    """
+    try:
+        with zipfile.ZipFile(bundle_file) as bundle:
+            infos = bundle.infolist()
+            if any(info.file_size > MAX_ENTRY_BYTES for info in infos) \
+                    or sum(info.file_size for info in infos) > MAX_BUNDLE_BYTES:
+                raise ValueError("❌ Error: Font bundle is too large.")
+
+            manifest = json.loads(bundle.read(MANIFEST_ENTRY).decode("utf-8"))
+            if not isinstance(manifest, dict):
+                raise ValueError("❌ Error: Font bundle manifest is not an object.")
+            if manifest.get("format") != BUNDLE_FORMAT_VERSION:
+                raise ValueError(f"❌ Error: Unsupported font bundle format: {manifest.get('format')}")
+
+            file_hashes = manifest.get("files")
+            if not isinstance(file_hashes, dict) or \
+                    not all(isinstance(v, str) for v in file_hashes.values()):
+                raise ValueError("❌ Error: Font bundle manifest has no valid file list.")
+            names = set(bundle.namelist()) - {MANIFEST_ENTRY}
+            if names != set(file_hashes):
+                raise ValueError("❌ Error: Font bundle contents do not match its manifest.")
+
+            entries = {}
+            for name, expected_sha256 in file_hashes.items():
+                if not _is_valid_entry_name(name):
+                    raise ValueError(f"❌ Error: Unexpected entry in font bundle: {name}")
+                data = bundle.read(name)
+                if _sha256(data) != expected_sha256:
+                    raise ValueError(f"❌ Error: Checksum mismatch for {name} in font bundle.")
+                entries[name] = data
+    except (zipfile.BadZipFile, KeyError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError(f"❌ Error: Not a valid font bundle ({e}).")
+
+    if MAPPING_ENTRY not in entries or METADATA_ENTRY not in entries:
+        raise ValueError("❌ Error: Font bundle has no character mapping or metadata.")
+
+    content_sha256 = _content_sha256(file_hashes)
+    if manifest.get("content_sha256") != content_sha256:
+        raise ValueError("❌ Error: Font bundle content checksum does not match.")
+
+    _check_font_entries(entries)
+    return content_sha256, entries
+
+
+def _check_font_entries(entries):
+    # Checksums only prove the bundle is intact; this checks it is a usable font.
+    try:
+        char_mapping = json.loads(entries[MAPPING_ENTRY].decode("utf-8"))
+        metadata = json.loads(entries[METADATA_ENTRY].decode("utf-8"))
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError(f"❌ Error: Font bundle has invalid JSON ({e}).")
+
+    if not isinstance(metadata, dict):
+        raise ValueError("❌ Error: Font bundle metadata is not an object.")
+    if not isinstance(char_mapping, dict):
+        raise ValueError("❌ Error: Font bundle mapping is not an object.")
+    for char, filename in char_mapping.items():
+        if not char or not isinstance(filename, str) or GLYPH_ENTRY_PREFIX + filename not in entries:
+            raise ValueError(f"❌ Error: Font bundle maps {char!r} to a missing image file.")
+
+    if PREPARED_GLYPHS_ENTRY in entries:
+        glyphs = read_segment(entries[PREPARED_GLYPHS_ENTRY])
+        if glyphs.mapping_sha256 != _sha256(entries[MAPPING_ENTRY]):
+            raise ValueError("❌ Error: Font bundle prepared glyphs were built from a different mapping.")
+        if not set(glyphs) <= set(char_mapping):
+            raise ValueError("❌ Error: Font bundle prepared glyphs contain unmapped characters.")
+
+
+def import_font_bundle(bundle_file, fonts_base_folder):
+    """
+    Verifies a bundle and installs it as a font folder. Importing a bundle whose
+    content is already installed does nothing.
+
+    Args:
+        bundle_file: Path or readable binary file object of the bundle.
+        fonts_base_folder (str): Directory holding all font folders.
+
+    Returns:
+        tuple: A tuple containing:
+            - str: The font ID (folder name) of the imported font.
+            - bool: True if the font was newly installed, False if it was already present.
+
+    Raises:
+        ValueError: If the bundle is malformed or fails its integrity check.
+    """
+    content_sha256, entries = read_font_bundle(bundle_file)
+    font_id = font_id_for_bundle(content_sha256)
+    font_folder = os.path.join(fonts_base_folder, font_id)
+    if os.path.isdir(font_folder):
+        return font_id, False
+
+    # Write into a hidden staging folder and rename it into place, so a font folder
+    # is either complete or absent even with concurrent imports of the same bundle.
+    staging_folder = os.path.join(fonts_base_folder, f".import_{uuid.uuid4()}")
+    os.makedirs(staging_folder)
+    try:
+        for name, data in entries.items():
+            if name.startswith(GLYPH_ENTRY_PREFIX):
+                target = os.path.join(staging_folder, name[len(GLYPH_ENTRY_PREFIX):])
+            elif name == MAPPING_ENTRY:
+                target = os.path.join(staging_folder, "character_mapping.json")
+            elif name == METADATA_ENTRY:
+                target = os.path.join(staging_folder, "metadata.json")
+            elif name == PREPARED_GLYPHS_ENTRY:
+                target = os.path.join(staging_folder, PREPARED_GLYPHS_FILE)
+            else:
+                continue
+            with open(target, "wb") as f:
+                f.write(data)
+
+        try:
+            os.rename(staging_folder, font_folder)
+        except OSError:
+            if os.path.isdir(font_folder):
+                return font_id, False # Another import of the same bundle won the race
+            raise
+    finally:
+        if os.path.isdir(staging_folder):
+            shutil.rmtree(staging_folder, ignore_errors=True)
+
+    return font_id, True
@@ -3,6 +3,8 @@ import json
 import cv2
 import numpy as np
 import sys
+from glyph_cache import get_font_glyphs
+from strip_cache import StripCache
 
 # Constants for character sizing and alignment.
 # These values are crucial for good visual output and might require calibration
@@ -37,6 +39,15 @@ BASE_LETTER_SCALE_FACTOR = 0.9
 # Increased slightly to make descenders proportionally larger than ascenders, which is natural.
 DESCENDER_SCALE_FACTOR = 1.1 # Adjusted to make descenders slightly taller than ascenders, proportionally.
 
+# Rendered word and line strips are memoized, keyed by font version, so repetitive
+# documents only pay the compositing cost once per distinct word/line.
+# Each cache is bounded by its total size in bytes (least recently used strips are evicted).
+WORD_STRIP_CACHE_BYTES = 64 * 1024 * 1024
+LINE_STRIP_CACHE_BYTES = 64 * 1024 * 1024
+
+word_strip_cache = StripCache(WORD_STRIP_CACHE_BYTES)
+line_strip_cache = StripCache(LINE_STRIP_CACHE_BYTES)
+
 def load_character_images(font_image_folder, mapping_file_path):
     """
     Loads character images from a specified font folder and prepares them for generation.
@@ -187,6 +198,70 @@ def load_character_images(font_image_folder, mapping_file_path):
     print(f"✅ Loaded {len(char_images)} characters from {font_image_folder}.")
     return char_images, FULL_CHAR_BOX_HEIGHT
 
+def render_word_strip(glyphs, word):
+    """
+    Renders a single word (no spaces) as one strip, using the word strip cache.
+
+    Args:
+        glyphs (PackedGlyphFont): The font's glyphs.
+        word (str): The word to render.
+
+    Returns:
+        np.ndarray: The word strip, or None if none of its characters are in the font.
+    """
+    key = (glyphs.name, word)
+    strip = word_strip_cache.get(key)
+    if strip is not None:
+        return strip
+
+    char_strips = []
+    for char in word:
+        if char in glyphs:
+            char_strips.append(glyphs.get(char))
+        else:
+            print(f"⚠️ Warning: No image found or invalid image for '{char}'")
+
+    if not char_strips:
+        return None
+    strip = np.hstack(char_strips)
+    word_strip_cache.put(key, strip)
+    return strip
+
+def render_line_strip(glyphs, line, space_image):
+    """
+    Renders a line of text as one strip, assembled from cached word strips
+    separated by space_image gaps. Whole lines are cached as well.
+
+    Args:
+        glyphs (PackedGlyphFont): The font's glyphs.
+        line (str): The line of text to render.
+        space_image (np.ndarray): Blank strip inserted for every space.
+
+    Returns:
+        np.ndarray: The line strip, or None if the line has nothing to draw.
+    """
+    words = line.split(" ")
+    if len(words) == 1:
+        return render_word_strip(glyphs, line)
+
+    key = (glyphs.name, space_image.shape[1], line)
+    strip = line_strip_cache.get(key)
+    if strip is not None:
+        return strip
+
+    strips = []
+    for idx, word in enumerate(words):
+        if idx > 0:
+            strips.append(space_image)
+        if word:
+            word_strip = render_word_strip(glyphs, word)
+            if word_strip is not None:
+                strips.append(word_strip)
+
+    strip = np.hstack(strips)
+    line_strip_cache.put(key, strip)
+    return strip
+
 def generate_text_image(text, output_path="generated_text_multiline.png", 
                         font_image_folder=None, mapping_file_path=None):
     """
@@ -207,9 +282,11 @@ def generate_text_image(text, output_path="generated_text_multiline.png",
     if font_image_folder is None or mapping_file_path is None:
         raise ValueError("Font image folder and mapping file path are required for text generation.")
 
-    char_images, full_char_box_height = load_character_images(font_image_folder, mapping_file_path)
+    # Glyphs are prepared once per node and shared bit-packed across worker processes
+    char_images = get_font_glyphs(font_image_folder, mapping_file_path, load_character_images)
+    full_char_box_height = char_images.height
     
-    if not char_images:
+    if not len(char_images):
         print("❌ No character images loaded. Cannot generate text.")
         return None
 
@@ -227,18 +304,9 @@ def generate_text_image(text, output_path="generated_text_multiline.png",
     max_line_overall_width = 0
 
     for line in lines:
-        generated_images_in_line = []
-        for char in line:
-            if char == " ":
-                generated_images_in_line.append(space_image)
-            elif char in char_images and char_images[char] is not None and char_images[char].size > 0:
-                generated_images_in_line.append(char_images[char])
-            else:
-                print(f"⚠️ Warning: No image found or invalid image for '{char}'")
-
-        if generated_images_in_line:
-            # All images are already padded to full_char_box_height in load_character_images
-            line_image = np.hstack(generated_images_in_line)
+        # All glyphs are already padded to full_char_box_height in load_character_images
+        line_image = render_line_strip(char_images, line, space_image)
+        if line_image is not None:
             line_images.append(line_image)
             max_line_overall_width = max(max_line_overall_width, line_image.shape[1])
 
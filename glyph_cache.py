@@ -0,0 +1,383 @@
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Glyph canvases are essentially binary ink, so each font is stored once per node in
+# shared memory as bit-packed rows (1 bit per pixel instead of 1 byte). Every worker
+# process maps the same segment and unpacks a glyph only when it is composited. Segments
+# are never written after their MAGIC marker is published; PackedGlyphFont only reads them
+# through a read-only view.
+#
+# Segment layout:
+#   MAGIC (8 bytes, written last so readers know the segment is complete)
+#   header length (little-endian uint64)
+#   header JSON: {"height": int, "data_size": int, "mapping_sha256": str,
+#                 "glyphs": {char: [offset, width], ...}}
+#   packed glyph data (offsets are relative to the start of this block)
+MAGIC = b"WRTGLYF1"
+PREFIX_SIZE = len(MAGIC) + 8
+INK_THRESHOLD = 128 # Pixels darker than this are treated as ink
+READY_TIMEOUT_SECONDS = 10
+# Optional prebuilt segment stored in a font folder (e.g. by a font bundle import).
+# Used instead of re-preparing the glyphs when its mapping_sha256 matches the current mapping.
+PREPARED_GLYPHS_FILE = "prepared_glyphs.bin"
+# Segment names are SEGMENT_PREFIX + <fonts base folder hash> + <font folder hash> + "_" +
+# <mapping version hash>. The base folder part scopes cleanup to one deployment, and the
+# fixed font part lets outdated versions of a font be found and unlinked.
+# (Names stay under 31 characters, the macOS limit.)
+SEGMENT_PREFIX = "writeit_"
+# Where POSIX shared memory segments are visible as files (Linux). On other platforms
+# outdated segments are only removed by the process that sees the remap.
+SHM_DIR = "/dev/shm"
+
+_fonts = {} # font folder -> PackedGlyphFont mapped by this process
+_fonts_lock = threading.Lock() # Guards _fonts and _font_locks; never held while building
+_font_locks = {} # font folder -> Lock serializing segment builds for that font
+
+
+class PackedGlyphFont:
+    """
+    Read-only view of a font's bit-packed glyphs.
+
+    Args:
+        buf: Buffer holding a complete segment (shared memory or a local bytearray).
+        shm (SharedMemory): The shared memory handle backing buf, kept alive with this object.
+        name (str): Shared memory segment name, which also identifies the font version.
+    """
+    def __init__(self, buf, shm=None, name=None):
+        # SharedMemory maps segments read-write, so enforce read-only access here
+        self._buf = memoryview(buf).toreadonly()
+        self._shm = shm
+        self.name = name
+
+        (header_len,) = struct.unpack_from("<Q", buf, len(MAGIC))
+        header = json.loads(bytes(buf[PREFIX_SIZE:PREFIX_SIZE + header_len]).decode("utf-8"))
+        self.height = header["height"]
+        self.mapping_sha256 = header.get("mapping_sha256")
+        self._glyphs = header["glyphs"]
+        self._data_offset = PREFIX_SIZE + header_len
+        self._size = self._data_offset + header["data_size"]
+
+    def __del__(self):
+        # Release the read-only view first, otherwise SharedMemory cannot close its mapping
+        self._buf.release()
+
+    def __contains__(self, char):
+        return char in self._glyphs
+
+    def __len__(self):
+        return len(self._glyphs)
+
+    def __iter__(self):
+        return iter(self._glyphs)
+
+    def get(self, char):
+        """
+        Unpacks a glyph into a white-background uint8 canvas.
+
+        Returns:
+            np.ndarray: Canvas of shape (height, width), or None if the char is not in the font.
+        """
+        entry = self._glyphs.get(char)
+        if entry is None:
+            return None
+        offset, width = entry
+        row_bytes = (width + 7) // 8
+        packed = np.frombuffer(self._buf, dtype=np.uint8, count=self.height * row_bytes,
+                               offset=self._data_offset + offset).reshape(self.height, row_bytes)
+        ink = np.unpackbits(packed, axis=1, count=width)
+        return (ink ^ 1) * np.uint8(255)
+
+    def tobytes(self):
+        """
+        Returns a copy of the complete segment, e.g. to store it in a font bundle.
+        """
+        return bytes(self._buf[:self._size])
+
+
+def pack_glyphs(char_images, height, mapping_sha256=None):
+    """
+    Bit-packs prepared character canvases into a complete segment.
+
+    Args:
+        char_images (dict): Characters mapped to uint8 canvases of shape (height, width).
+        height (int): Common canvas height of all glyphs.
+        mapping_sha256 (str): Hash of the mapping file the glyphs were prepared from.
+
+    Returns:
+        bytes: The segment contents, including the MAGIC marker.
+    """
+    glyphs = {}
+    chunks = []
+    offset = 0
+    for char, canvas in char_images.items():
+        packed = np.packbits(canvas < INK_THRESHOLD, axis=1)
+        glyphs[char] = [offset, int(canvas.shape[1])]
+        chunks.append(packed.tobytes())
+        offset += packed.nbytes
+
+    header = json.dumps({
+        "height": int(height),
+        "data_size": offset,
+        "mapping_sha256": mapping_sha256,
+        "glyphs": glyphs,
+    }).encode("utf-8")
+    return MAGIC + struct.pack("<Q", len(header)) + header + b"".join(chunks)
+
+
+def read_segment(segment):
+    """
+    Parses and validates a segment produced by pack_glyphs.
+
+    Args:
+        segment (bytes): The segment contents.
+
+    Returns:
+        PackedGlyphFont: The glyphs, backed by a private copy of segment.
+
+    Raises:
+        ValueError: If the segment is truncated, not a glyph segment, or a glyph lies
+            outside the packed data.
+    """
+    try:
+        if segment[:len(MAGIC)] != MAGIC:
+            raise ValueError("bad marker")
+        font = PackedGlyphFont(bytearray(segment))
+        data_size = font._size - font._data_offset
+        if font._size != len(segment) or not _is_int(data_size) or data_size < 0:
+            raise ValueError("size mismatch")
+        if not _is_int(font.height) or font.height <= 0:
+            raise ValueError("invalid height")
+        if not isinstance(font._glyphs, dict):
+            raise ValueError("invalid glyph table")
+
+        # Every glyph's packed rows must lie inside the data block, so get() can never
+        # read past it in the middle of a render.
+        for char, entry in font._glyphs.items():
+            if not isinstance(entry, list) or len(entry) != 2 or not all(_is_int(v) for v in entry):
+                raise ValueError(f"invalid entry for {char!r}")
+            offset, width = entry
+            if offset < 0 or width <= 0 or offset + font.height * ((width + 7) // 8) > data_size:
+                raise ValueError(f"glyph {char!r} is out of bounds")
+        return font
+    except (ValueError, KeyError, TypeError, struct.error) as e:
+        raise ValueError(f"❌ Error: Invalid prepared glyph data ({e}).")
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _build_segment(font_image_folder, mapping_file_path, load_glyphs):
+    with open(mapping_file_path, "rb") as f:
+        mapping_sha256 = hashlib.sha256(f.read()).hexdigest()
+
+    prepared_path = os.path.join(font_image_folder, PREPARED_GLYPHS_FILE)
+    if os.path.exists(prepared_path):
+        with open(prepared_path, "rb") as f:
+            segment = f.read()
+        try:
+            if read_segment(segment).mapping_sha256 == mapping_sha256:
+                return segment
+        except ValueError as e:
+            print(f"⚠️ Warning: Ignoring {prepared_path}: {e}")
+
+    char_images, height = load_glyphs(font_image_folder, mapping_file_path)
+    return pack_glyphs(char_images, height, mapping_sha256)
+
+
+def _short_hash(path):
+    return hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:6]
+
+
+def _deployment_segment_prefix(fonts_base_folder):
+    return SEGMENT_PREFIX + _short_hash(fonts_base_folder)
+
+
+def _font_segment_prefix(font_image_folder):
+    fonts_base_folder = os.path.dirname(os.path.abspath(font_image_folder))
+    return _deployment_segment_prefix(fonts_base_folder) + _short_hash(font_image_folder) + "_"
+
+
+def _segment_name(font_image_folder, mapping_file_path):
+    # The name changes whenever the mapping file changes, so a re-mapped font gets a new segment.
+    stat = os.stat(mapping_file_path)
+    version = f"{stat.st_mtime_ns}|{stat.st_size}"
+    return _font_segment_prefix(font_image_folder) + hashlib.sha1(version.encode("utf-8")).hexdigest()[:8]
+
+
+def _unlink_font_segments(font_image_folder, keep=None):
+    # Removes every version of a font's segment except `keep`, including versions
+    # left behind when the mapping changed while no process had the font loaded.
+    if not os.path.isdir(SHM_DIR):
+        return
+    prefix = _font_segment_prefix(font_image_folder)
+    for name in os.listdir(SHM_DIR):
+        if name.startswith(prefix) and name != keep:
+            _unlink(name)
+
+
+def _untrack(shm):
+    # The multiprocessing resource tracker would unlink the segment when this process
+    # exits, pulling it out from under the other workers. Lifetime is managed here instead.
+    if os.name == "posix":
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+
+
+def _unlink(name):
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    except ValueError:
+        # Zero-size segment (its creator has not sized it yet, or died before doing so),
+        # which cannot be mapped; remove it by name instead.
+        try:
+            os.unlink(os.path.join(SHM_DIR, name))
+        except FileNotFoundError:
+            pass
+        return
+    shm.close()
+    try:
+        shm.unlink() # Also drops the resource tracker registration made by the attach above
+    except FileNotFoundError:
+        pass
+
+
+def _attach_when_ready(name):
+    # Returns the attached segment once its creator has written MAGIC, None if it does
+    # not exist, or False if it is still incomplete after READY_TIMEOUT_SECONDS.
+    deadline = time.monotonic() + READY_TIMEOUT_SECONDS
+    shm = None
+    while True:
+        if shm is None:
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+                _untrack(shm)
+            except FileNotFoundError:
+                return None
+            except ValueError:
+                pass # Zero-size: the creator has created but not yet sized the segment
+        if shm is not None and bytes(shm.buf[:len(MAGIC)]) == MAGIC:
+            return shm
+        if time.monotonic() > deadline:
+            if shm is not None:
+                shm.close()
+            return False
+        time.sleep(0.01)
+
+
+def _open_segment(name, build_segment, attempts=3):
+    shm = _attach_when_ready(name)
+    if shm:
+        return PackedGlyphFont(shm.buf, shm, name)
+    if shm is False:
+        # Writing a segment only takes a memcpy once it is created, so a segment that stays
+        # incomplete this long was left by a creator that died. Remove it and rebuild it here.
+        print(f"⚠️ Warning: Shared glyph segment {name} is incomplete, rebuilding it.")
+        _unlink(name)
+        if attempts <= 1:
+            return PackedGlyphFont(bytearray(build_segment()), None, name)
+
+    segment = build_segment()
+    try:
+        shm = shared_memory.SharedMemory(name=name, create=True, size=len(segment))
+    except FileExistsError:
+        # Another worker created it first; use theirs.
+        return _open_segment(name, build_segment, attempts - 1)
+    _untrack(shm)
+    shm.buf[len(MAGIC):len(segment)] = segment[len(MAGIC):]
+    shm.buf[:len(MAGIC)] = MAGIC
+    return PackedGlyphFont(shm.buf, shm, name)
+
+
+def cleanup_segments(fonts_base_folder):
+    """
+    Unlinks glyph segments of this fonts base folder that no longer match a current font,
+    e.g. versions left behind by mappings edited while the server was down, or by deleted
+    fonts. Segments of other deployments on the same host are left alone. Call once at startup.
+
+    Args:
+        fonts_base_folder (str): Directory holding all font folders.
+    """
+    if not os.path.isdir(SHM_DIR):
+        return
+    current = set()
+    for font_dir in os.listdir(fonts_base_folder):
+        mapping_file_path = os.path.join(fonts_base_folder, font_dir, "character_mapping.json")
+        if os.path.exists(mapping_file_path):
+            current.add(_segment_name(os.path.join(fonts_base_folder, font_dir), mapping_file_path))
+    prefix = _deployment_segment_prefix(fonts_base_folder)
+    for name in os.listdir(SHM_DIR):
+        if name.startswith(prefix) and name not in current:
+            _unlink(name)
+
+
+def get_font_glyphs(font_image_folder, mapping_file_path, load_glyphs):
+    """
+    Returns the shared, bit-packed glyphs of a font, building them at most once per node.
+
+    Args:
+        font_image_folder (str): Path to the directory containing extracted character images.
+        mapping_file_path (str): Path to the JSON file containing character mappings.
+        load_glyphs (callable): Called as load_glyphs(font_image_folder, mapping_file_path) when
+            the font is not in shared memory yet and has no up-to-date PREPARED_GLYPHS_FILE;
+            returns (char_images, canvas_height).
+
+    Returns:
+        PackedGlyphFont: The font's glyphs.
+
+    Raises:
+        ValueError: If the mapping file is not found.
+    """
+    if not os.path.exists(mapping_file_path):
+        raise ValueError(f"❌ Error: Mapping file not found at {mapping_file_path}")
+
+    name = _segment_name(font_image_folder, mapping_file_path)
+    key = os.path.abspath(font_image_folder)
+
+    with _fonts_lock:
+        font = _fonts.get(key)
+        if font is not None and font.name == name:
+            return font
+        font_lock = _font_locks.setdefault(key, threading.Lock())
+
+    # Building or waiting for a segment can take seconds, so only renders of this
+    # font wait for it; fonts that are already mapped keep rendering.
+    with font_lock:
+        with _fonts_lock:
+            font = _fonts.get(key)
+        if font is not None and font.name == name:
+            return font
+
+        font = _open_segment(name, lambda: _build_segment(font_image_folder, mapping_file_path, load_glyphs))
+        with _fonts_lock:
+            _fonts[key] = font
+
+    # Drop outdated versions of this font. Workers still using one keep their mapping.
+    _unlink_font_segments(font_image_folder, keep=name)
+    return font
+
+
+def release_font(font_image_folder, mapping_file_path):
+    """
+    Removes a font's glyphs from shared memory, e.g. before the font is deleted.
+
+    Args:
+        font_image_folder (str): Path to the directory containing extracted character images.
+        mapping_file_path (str): Path to the JSON file containing character mappings.
+    """
+    with _fonts_lock:
+        font = _fonts.pop(os.path.abspath(font_image_folder), None)
+    if font is not None:
+        _unlink(font.name)
+    if os.path.exists(mapping_file_path):
+        _unlink(_segment_name(font_image_folder, mapping_file_path))
+    _unlink_font_segments(font_image_folder)
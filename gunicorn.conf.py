@@ -0,0 +1,17 @@
+import os
+
+from render_pool import render_pool_settings
+
+# gunicorn loads this file automatically from the working directory.
+#
+# Request threads must outnumber the render pool's running + queued slots, otherwise
+# excess renders wait in gunicorn's unbounded connection backlog and never get the
+# 503 / Retry-After response. IO_THREADS adds headroom for non-render requests.
+_render_workers, _render_queue_limit = render_pool_settings()
+
+worker_class = "gthread"
+threads = _render_workers + _render_queue_limit + int(os.environ.get("IO_THREADS", 4))
+
+# Each worker process has its own render pool, so N workers allow N x RENDER_WORKERS
+# concurrent renders. Keep one process by default and scale RENDER_WORKERS instead.
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
@@ -0,0 +1,124 @@
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def render_pool_settings():
+    """
+    Reads the render pool size from the environment.
+
+    Returns:
+        tuple: A tuple containing:
+            - int: RENDER_WORKERS, jobs allowed to run at once (defaults to the CPU count).
+            - int: RENDER_QUEUE_LIMIT, jobs allowed to wait for a free worker (default 16).
+    """
+    max_workers = int(os.environ.get("RENDER_WORKERS", os.cpu_count() or 1))
+    max_queue = int(os.environ.get("RENDER_QUEUE_LIMIT", 16))
+    return max_workers, max_queue
+
+
+class RenderQueueFull(Exception):
+    """
+    Raised when a render/extraction job is rejected because the queue is full.
+
+    Attributes:
+        retry_after (int): Suggested number of seconds to wait before retrying.
+    """
+    def __init__(self, retry_after):
+        super().__init__(f"Render queue is full, retry after {retry_after}s.")
+        self.retry_after = retry_after
+
+
+class RenderPool:
+    """
+    Runs CPU-heavy jobs (text rendering, character extraction) on a dedicated,
+    size-bounded executor so request threads stay free for I/O.
+
+    At most `max_workers` jobs run at once and at most `max_queue` more may wait.
+    Anything beyond that is rejected immediately with RenderQueueFull instead of
+    piling up and slowing everyone down.
+
+    Args:
+        max_workers (int): Number of jobs allowed to run concurrently.
+        max_queue (int): Number of jobs allowed to wait for a free worker.
+    """
+    def __init__(self, max_workers, max_queue):
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="render")
+        self._lock = threading.Lock()
+
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._total_run = 0.0
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Runs fn(*args, **kwargs) on the render executor and blocks until it finishes.
+
+        Returns:
+            The return value of fn. Exceptions raised by fn are re-raised here.
+
+        Raises:
+            RenderQueueFull: If all workers are busy and the wait queue is full.
+        """
+        with self._lock:
+            if self._queued + self._running >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise RenderQueueFull(self._retry_after_locked())
+            self._queued += 1
+
+        enqueued_at = time.monotonic()
+
+        def job():
+            started_at = time.monotonic()
+            wait = started_at - enqueued_at
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._total_run += time.monotonic() - started_at
+
+        return self._executor.submit(job).result()
+
+    def _retry_after_locked(self):
+        # Estimate how long until the current backlog drains, at least 1 second.
+        if not self._completed:
+            return 1
+        avg_run = self._total_run / self._completed
+        backlog = self._queued + self._running
+        return max(1, math.ceil(avg_run * backlog / self.max_workers))
+
+    def stats(self):
+        """
+        Returns a snapshot of queue depth and wait time statistics.
+
+        Returns:
+            dict: Counters and timings (milliseconds) for the render queue.
+        """
+        with self._lock:
+            started = self._completed + self._running
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queue_depth": self._queued,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._total_wait / started * 1000, 2) if started else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 2),
+                "avg_run_ms": round(self._total_run / self._completed * 1000, 2) if self._completed else 0.0,
+            }
@@ -0,0 +1,61 @@
+import threading
+from collections import OrderedDict
+
+
+class StripCache:
+    """
+    Thread-safe LRU cache of rendered image strips, bounded by total bytes.
+
+    Args:
+        max_bytes (int): Evict least recently used strips once their combined size exceeds this.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._strips = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the cached strip for key, or None if it is not cached.
+        """
+        with self._lock:
+            strip = self._strips.get(key)
+            if strip is None:
+                self._misses += 1
+                return None
+            self._strips.move_to_end(key)
+            self._hits += 1
+            return strip
+
+    def put(self, key, strip):
+        """
+        Caches a strip. The array is made read-only since it is shared between renders.
+        """
+        if strip.nbytes > self.max_bytes:
+            return
+        strip.flags.writeable = False
+        with self._lock:
+            previous = self._strips.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._strips[key] = strip
+            self._bytes += strip.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._strips.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def stats(self):
+        """
+        Returns entry count, size and hit/miss counters.
+        """
+        with self._lock:
+            return {
+                "entries": len(self._strips),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+            }